@@ -52,6 +52,8 @@ def test_pivot_table_of_df():
     pivot_table = uf.User.pivot_table_of_df(main_data)
     assert pivot_table.shape == (3, 3)
     assert list(pivot_table.columns) == [101, 102, 103]
+    assert pivot_table.loc[3, 103] == DISLIKE
+    assert pivot_table.loc[3, 101] == 0
 
 # Test `abs_deviation`
 
@@ -66,6 +68,17 @@ def test_abs_deviation():
     abs_dev = uf.User.abs_deviation(recipes_rating, pivot_table)
     assert abs_dev.shape == pivot_table.shape
 
+
+def test_abs_deviation_np():
+    recipes_rating = np.array([[1, -1]])
+    pivot = np.array([[1, 0], [-1, 1]], dtype=np.int16)
+    abs_dev = uf.User.abs_deviation_np(recipes_rating, pivot)
+    np.testing.assert_array_equal(abs_dev, [[0, 1], [2, 2]])
+    # in place computation
+    abs_dev = uf.User.abs_deviation_np(recipes_rating, pivot, out=pivot)
+    assert abs_dev is pivot
+    np.testing.assert_array_equal(pivot, [[0, 1], [2, 2]])
+
 # Test `percentile_filter`
 
 
@@ -135,6 +148,60 @@ def test_percentile_filter():
                                   interactions_pivot_C.reset_index(drop=True),
                                   "The DataFrame should not be modified.")
 
+# Test `factorize_interactions` and `neighbor_distances`
+
+
+def test_factorize_interactions_cache(setup_user):
+    user = setup_user
+    interactions = user.get_interactions
+    factorized = uf.User.factorize_interactions(interactions)
+    assert uf.User.factorize_interactions(interactions) is factorized
+    assert list(factorized[1]) == [1, 2, 3, 4]
+    assert list(factorized[3]) == [101, 102, 103]
+    uf.User.clear_cache()
+    assert uf.User.factorize_interactions(interactions) is not factorized
+
+
+def test_codes_of():
+    codes = uf.User.codes_of(np.array([101, 102, 103]), [103, 999, 101])
+    assert list(codes) == [2, -1, 0]
+    assert list(uf.User.codes_of(np.array([]), [101])) == [-1]
+
+
+def test_rows_of_codes():
+    codes = np.array([1, 0, 1, 2])
+    order = np.argsort(codes, kind="stable")
+    indptr = np.array([0, 1, 3, 4])
+    rows, which = uf.User.rows_of_codes(order, indptr, np.array([2, 1]))
+    assert list(rows) == [3, 0, 2]
+    assert list(which) == [0, 1, 1]
+
+
+def test_neighbor_distances(setup_user):
+    user = setup_user
+    distances = user.neighbor_distances([102, 103], np.array([LIKE, LIKE]))
+    # user 3 disliked 103 and did not rate 102: 1 + 2 = 3
+    assert list(distances.index) == [2, 3, 4]
+    assert list(distances["dist"]) == [1, 3, 0]
+    assert distances["dist"].dtype == np.int32
+    # user 3 disliked 103: the exact opposite, so it is excluded
+    distances = user.neighbor_distances([103], np.array([LIKE]))
+    assert list(distances.index) == [4]
+
+# Test `smallest_indices`
+
+
+def test_smallest_indices():
+    values = np.array([5, 1, 8, 3, 2, 9])
+    assert list(uf.User.smallest_indices(values, 3)) == [1, 4, 3]
+    assert list(uf.User.smallest_indices(values, 10)) == [1, 4, 3, 0, 2, 5]
+    assert len(uf.User.smallest_indices(values, 0)) == 0
+    # ties are broken by position
+    values = np.array([2, 0, 2, 1, 2, 2, 0])
+    for k in range(len(values) + 1):
+        assert list(uf.User.smallest_indices(values, k)) == \
+            list(np.argsort(values, kind="stable")[:k])
+
 # Test `add_preferences` and `del_preferences`
 
 
@@ -233,3 +300,116 @@ def test_common_likes(setup_user,):
     assert df.loc[4, NEIGHBOR_DATA[0]] == 1
     assert df.loc[4, NEIGHBOR_DATA[1]] == 0
     assert df.loc[4, NEIGHBOR_DATA[2]] == 1
+
+
+def test_pivot_of_neighbors_shared(setup_user):
+    user = setup_user
+
+    user.add_preferences(102, LIKE)
+    user.recipe_suggestion()
+    first = user.pivot_of_neighbors()
+    assert all(a is b for a, b in zip(first, user.pivot_of_neighbors()))
+
+    user.add_preferences(103, LIKE)
+    user.recipe_suggestion()
+    assert user.pivot_of_neighbors()[2] is not first[2]
+
+
+def test_neighbor_data_fresh_user(setup_user):
+    user = setup_user
+
+    df = user.get_neighbor_data(LIKE)
+
+    assert df.empty
+    assert list(df.columns) == NEIGHBOR_DATA
+
+
+def test_batch_neighbor_data():
+    ratings = np.array([[LIKE, DISLIKE, 0],
+                        [LIKE, LIKE, DISLIKE]], dtype=np.int8)
+    users_ratings = np.array([[LIKE, 0, 0],
+                              [0, DISLIKE, DISLIKE]], dtype=np.int8)
+    counts = uf.User.batch_neighbor_data(ratings, users_ratings)
+    assert counts.shape == (2, 2, 3)
+    assert counts[0].tolist() == [[1, 0, 0], [1, 0, 1]]
+    assert counts[1].tolist() == [[0, 1, 1], [0, 1, 2]]
+
+
+def test_load_datasets(mocker, tmp_path):
+    path = tmp_path / "interactions.csv"
+    path.write_text(",user_id,recipe_id,rate\n0,1,101,1.0\n1,2,102,-1.0\n")
+    mocker.patch("webapp_food.user_fooder.USER_MAIN_DF", str(path))
+    mocker.patch("webapp_food.user_fooder.USER_DESSERT_DF", str(path))
+    # Start without datasets loaded at the class level
+    mocker.patch.object(uf.User, "_User__interactions_main", None,
+                        create=True)
+    mocker.patch.object(uf.User, "_User__interactions_dessert", None,
+                        create=True)
+    read = mocker.spy(uf.User, "read_interactions")
+    user = uf.User(type_of_dish="main")
+    interactions = user.get_interactions
+    assert list(interactions.columns) == USER_COLUMNS
+    assert list(interactions[USER_COLUMNS[0]]) == [1, 2]
+    assert list(interactions[USER_COLUMNS[2]]) == [LIKE, DISLIKE]
+    # The datasets are only loaded once
+    uf.User(type_of_dish="dessert")
+    assert read.call_count == 2
+
+
+def test_random_recipe(setup_user):
+    user = setup_user
+    assert list(user.get_interactions_arrays.popularity) == [1, 2, 2]
+    assert user.random_recipe([101, 102]) == 103
+    with pytest.raises(ValueError):
+        user.random_recipe([101, 102, 103])
+
+
+def test_preferences_arrays(setup_user):
+    user = setup_user
+    for recipe in range(100, 120):
+        user.add_preferences(recipe, LIKE)
+    user.add_preferences(105, DISLIKE)
+    user.del_preferences(100)
+    recipes, rates = user.get_preferences_arrays
+    assert list(recipes) == list(user.get_preferences.keys())
+    assert list(rates) == list(user.get_preferences.values())
+    assert rates.dtype == np.int8
+    assert user.get_preferences_reversed == \
+        list(reversed(user.get_preferences.items()))
+
+
+def test_read_interactions_parquet(tmp_path):
+    path = tmp_path / "interactions.csv"
+    path.write_text(",user_id,recipe_id,rate\n0,1,101,1.0\n")
+    interactions = uf.User.read_interactions(str(path))
+    assert (tmp_path / "interactions.parquet").exists()
+    cached = uf.User.read_interactions(str(path))
+    pd.testing.assert_frame_equal(interactions, cached)
+    assert list(interactions.dtypes) == [np.int32, np.int32, np.int8]
+
+
+def test_read_interactions_corrupted_parquet(tmp_path):
+    path = tmp_path / "interactions.csv"
+    path.write_text(",user_id,recipe_id,rate\n0,1,101,1.0\n")
+    interactions = uf.User.read_interactions(str(path))
+    # A partial copy, newer than the CSV, is read from the CSV again
+    parquet_path = tmp_path / "interactions.parquet"
+    parquet_path.write_bytes(parquet_path.read_bytes()[:10])
+    pd.testing.assert_frame_equal(uf.User.read_interactions(str(path)),
+                                  interactions)
+    pd.testing.assert_frame_equal(pd.read_parquet(parquet_path),
+                                  interactions)
+    assert sorted(file.name for file in tmp_path.iterdir()) == \
+        ["interactions.csv", "interactions.parquet"]
+
+
+def test_recipe_suggestion_memoized(setup_user, mocker):
+    user = setup_user
+    user.add_preferences(102, LIKE)
+    recipe_suggested = user.recipe_suggestion()
+    distances = mocker.spy(user, "neighbor_distances")
+    assert user.recipe_suggestion() == recipe_suggested
+    distances.assert_not_called()
+    user.add_preferences(101, LIKE)
+    user.recipe_suggestion()
+    distances.assert_called_once()
@@ -1,6 +1,7 @@
 import pytest
 from webapp_food.utils import print_image, ImageError, \
-    update_preferences, fetch_recipe_details
+    update_preferences, fetch_recipe_details, \
+    read_recipes, write_atomically
 import pandas as pd
 from webapp_food.settings import LIKE
 
@@ -62,3 +63,43 @@ def test_fetch_recipe_details():
     steps, ingredients = fetch_recipe_details(recipes_df, 0)
     assert steps == ['Step 1', 'Step 2']
     assert ingredients == ['Ingredient 1', 'Ingredient 2']
+
+
+def test_read_recipes_ipc(tmp_path):
+    path = tmp_path / "recipes.csv"
+    path.write_text(",name,steps,ingredients\n"
+                    "42,Cake,\"['Step 1']\",\"['Egg']\"\n")
+    recipes = read_recipes(str(path))
+    assert (tmp_path / "recipes.arrow").exists()
+    cached = read_recipes(str(path))
+    pd.testing.assert_frame_equal(recipes, cached)
+    assert cached.loc[42, "name"] == "Cake"
+    assert fetch_recipe_details(recipes, 42) == (['Step 1'], ['Egg'])
+    assert fetch_recipe_details(cached, 42) == (['Step 1'], ['Egg'])
+
+
+def test_read_recipes_corrupted_ipc(tmp_path):
+    path = tmp_path / "recipes.csv"
+    path.write_text(",name,steps,ingredients\n"
+                    "42,Cake,\"['Step 1']\",\"['Egg']\"\n")
+    recipes = read_recipes(str(path))
+    # A partial copy, newer than the CSV, is read from the CSV again
+    ipc_path = tmp_path / "recipes.arrow"
+    ipc_path.write_bytes(ipc_path.read_bytes()[:10])
+    pd.testing.assert_frame_equal(read_recipes(str(path)), recipes)
+    pd.testing.assert_frame_equal(read_recipes(str(path)), recipes)
+
+
+def test_write_atomically(tmp_path):
+    path = tmp_path / "data.bin"
+    write_atomically(path, lambda tmp: open(tmp, "wb").write(b"data"))
+    assert path.read_bytes() == b"data"
+
+    def failing_write(tmp):
+        open(tmp, "wb").write(b"partial")
+        raise OSError("disk full")
+    with pytest.raises(OSError):
+        write_atomically(path, failing_write)
+    # The previous file is untouched and no temporary file is left
+    assert path.read_bytes() == b"data"
+    assert list(tmp_path.iterdir()) == [path]
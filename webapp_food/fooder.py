@@ -9,11 +9,12 @@ including:
 - Displaying recommended recipes and their details.
 """
 
+import textwrap
 import streamlit as st
 from webapp_food.utils import update_preferences, print_image, \
-    ImageError, fetch_recipe_details, visualize_graph, NoNeighborError
+    ImageError, fetch_recipe_details, visualize_graph, NoNeighborError, \
+    read_recipes
 from webapp_food.user_fooder import User
-import pandas as pd
 import logging
 from webapp_food.settings import COLORS, LIKE, DISLIKE, \
     RECIPE_COLUMNS, RECIPE_DF, TYPE_OF_DISH
@@ -25,6 +26,149 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Static HTML of the first page of the website
+_MAIN_PAGE_HTML = textwrap.dedent(
+    """
+    <div style="text-align: center;font-size:20px">
+        Are you in the mood for a main dish or a dessert? Choose one below:
+        <br><br><br>
+    </div>
+    """
+)
+
+# Static HTML of the recommendation page, above and below the recipe
+_RECOMMENDATION_HTML = textwrap.dedent(
+    """
+    <div style="text-align: center; font-size:20px">
+    Here is a recipe for you
+    (please feel free to expand the recipe's details) <br>
+    Let us know if you like it or not so that
+    we can recommend a better one next.  <br>
+    For that, click on the 'like' and 'dislike' buttons below:
+    </div>
+    """
+)
+_RESET_WARNING_HTML = textwrap.dedent(
+    """
+    <div style="text-align: center;">
+        <br><br><br><br>
+        Choosing a new type of dish will reset your recommendation algorithm
+        <br><br>
+    </div>
+    """
+)
+
+# Static HTML of the graph page
+_EXPLANATION_HTML = textwrap.dedent(
+    f"""
+    <div style="text-align: justify; font-size:20px; color:\
+    {COLORS['first_color']}; font-weight: bold">
+    Fooder is a food recommendation website based
+    on a nearest neighbors algorithm.
+    Next recipe is recommended in function of your nearest neighbors,
+    depending on you and the other users likes and dislikes.
+    Other users's preferences come from a dataset of recipes
+    leaked from Fooder.com. On this page you can see your adjency
+    graph with the users that are closest to you, as well as
+    the number of recipes they can still recommend to you.
+    <br><br>
+    </div>
+    """
+)
+_NO_NEIGHBOR_HTML = textwrap.dedent(
+    """
+    <div style="text-align: center; font-size:30px">
+        <br><br><br><br>
+        You have not yet liked or disliked any recipe, <br>
+        or you have no near neighbors in the database
+        from your current preferences.
+        <br><br>
+    </div>
+    """
+)
+
+# Styles of the website: removing padding, title style and button style
+_STYLE_HTML = textwrap.dedent(
+    f"""
+    <style>
+    .css-18e3th9 {{
+        padding-top: 0;
+    }}
+    .block-container {{
+        padding-top: 0;
+    }}
+    h1 {{
+        text-align: center;
+        color: {COLORS['first_color']};
+        height: 150px;
+    }}
+    div.stButton {{
+        display: flex;
+        justify-content: center;
+    }}
+    div.stButton > button {{
+        padding: 20px 40px;
+        font-size: 20px;
+        border-radius: 10px;
+    }}
+    .st-key-recipe_image [data-testid="stImage"] {{
+        display: flex;
+        justify-content: center;
+    }}
+    .st-key-recipe_image img {{
+        height: 200px;
+        object-fit: cover;
+        border-radius: 50%;
+        border: 2px solid #000;
+    }}
+    </style>
+    """
+)
+
+
+@st.cache_resource
+def load_raw_recipes():
+    """
+    Loads the recipes dataset once per process, shared by all sessions.
+    """
+    return read_recipes(RECIPE_DF)
+
+
+@st.cache_resource
+def load_recipe_names():
+    """
+    Maps each recipe ID to its name, built once per process.
+    """
+    raw_recipes = load_raw_recipes()
+    return dict(zip(raw_recipes.index.to_list(),
+                    raw_recipes[RECIPE_COLUMNS[0]].to_list()))
+
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def recipe_panel(recipe_index):
+    """
+    Builds the name, steps and ingredients texts of a recipe page, once
+    per recipe.
+    """
+    steps, ingredients = fetch_recipe_details(load_raw_recipes(),
+                                              recipe_index)
+    return (load_recipe_names()[recipe_index], '  \n'.join(steps),
+            '  \n'.join(ingredients))
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_image(recipe_name):
+    """
+    Searches the image of a recipe at most once an hour, failed searches
+    included, which are cached as None.
+    """
+    try:
+        return print_image(recipe_name, 1)[0]
+    except ImageError as e:
+        logging.info(e)
+        return None
+
+
 # Page state variables
 GRAPH_VIZ = HISTORY = GRAPH_ERROR = False
 
@@ -32,119 +176,60 @@ GRAPH_VIZ = HISTORY = GRAPH_ERROR = False
 Page management: handling of the different variables
 depending on the user's actions on the website
 """
-if not st.session_state:
-    st.session_state.raw_recipes = pd.read_csv(
-        RECIPE_DF, index_col=0)
+# The recipes are shared by the sessions through load_raw_recipes, only the
+# logging is set up per session
+if "logger" not in st.session_state:
     st.session_state.logger = logging.getLogger(__name__)
     logging.basicConfig(filename='fooder.log', level=logging.INFO)
 
-if st.session_state.get("like"):
-    logging.debug("Like button clicked")
-    update_preferences(st.session_state.user,
-                       st.session_state.last_recommended_index, LIKE)
-
-if st.session_state.get("dislike"):
-    logging.debug("Dislike button clicked")
-    update_preferences(st.session_state.user,
-                       st.session_state.last_recommended_index, DISLIKE)
+# Only the button clicked triggers the rerun
+BUTTON_CLICKED = next(
+    (key for key in ("like", "dislike", TYPE_OF_DISH[0], TYPE_OF_DISH[1],
+                     "graph", "dislike_graph", "like_graph", "back")
+     if st.session_state.get(key)), None)
 
-if st.session_state.get(TYPE_OF_DISH[0]):
-    logging.debug("Main button clicked")
-    st.session_state.user = User(TYPE_OF_DISH[0])
-
-if st.session_state.get(TYPE_OF_DISH[1]):
-    logging.debug("Dessert button clicked")
-    st.session_state.user = User(TYPE_OF_DISH[1])
-
-if st.session_state.get("graph"):
-    logging.debug("Graph button clicked")
-    if st.session_state.get("user"):
+match BUTTON_CLICKED:
+    case "like":
+        logging.debug("Like button clicked")
+        update_preferences(st.session_state.user,
+                           st.session_state.last_recommended_index, LIKE)
+    case "dislike":
+        logging.debug("Dislike button clicked")
+        update_preferences(st.session_state.user,
+                           st.session_state.last_recommended_index, DISLIKE)
+    case dish if dish in TYPE_OF_DISH:
+        logging.debug("%s button clicked", dish.capitalize())
+        st.session_state.user = User(dish)
+    case "graph":
+        logging.debug("Graph button clicked")
+        if st.session_state.get("user"):
+            GRAPH_VIZ = True
+            st.session_state.graph_type = LIKE
+        else:
+            GRAPH_ERROR = True
+    case "dislike_graph":
+        logging.debug("Dislike graph button clicked")
+        st.session_state.graph_type = DISLIKE
         GRAPH_VIZ = True
+    case "like_graph":
+        logging.debug("Like graph button clicked")
         st.session_state.graph_type = LIKE
-    else:
-        GRAPH_ERROR = True
-
-if st.session_state.get("dislike_graph"):
-    logging.debug("Dislike graph button clicked")
-    st.session_state.graph_type = DISLIKE
-    GRAPH_VIZ = True
-
-if st.session_state.get("like_graph"):
-    logging.debug("Like graph button clicked")
-    st.session_state.graph_type = LIKE
-    GRAPH_VIZ = True
-
-if st.session_state.get("back"):
-    logging.debug("Back button clicked")
-    GRAPH_VIZ = False
-    if st.session_state.get("user"):
-        if st.session_state.get("user").get_type_of_dish == TYPE_OF_DISH[0]:
-            MAIN = True
-        else:
-            DESSERT = True
+        GRAPH_VIZ = True
+    case "back":
+        logging.debug("Back button clicked")
+        GRAPH_VIZ = False
 
 # Page management: handling of the different pages
 MAIN_PAGE = not (GRAPH_VIZ) and not (st.session_state.get("user"))
 RECOMMENDATION_PAGE = not (GRAPH_VIZ) and (
     st.session_state.get("user"))
 
-# Page management: different styles for the website
-# removing padding
-st.markdown(
-    """
-    <style>
-    .css-18e3th9 {
-        padding-top: 0;
-    }
-    .block-container {
-        padding-top: 0;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
-# title style
-st.markdown(
-    f"""
-    <style>
-    h1 {{
-        text-align: center;
-        color: {COLORS['first_color']};
-        height: 150px;
-    }}
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
-# button style
-st.markdown(
-    """
-        <style>
-        div.stButton {
-            display: flex;
-            justify-content: center;
-        }
-        div.stButton > button {
-            padding: 20px 40px;
-            font-size: 20px;
-            border-radius: 10px;
-        }
-        </style>
-        """,
-    unsafe_allow_html=True
-)
+# Page management: different styles for the website, sent in one element
+st.markdown(_STYLE_HTML, unsafe_allow_html=True)
 # Page display: First page of the website
 if MAIN_PAGE:
     st.title("Fooder")
-    st.write(
-        """
-        <div style="text-align: center;font-size:20px">
-            Are you in the mood for a main dish or a dessert? Choose one below:
-            <br><br><br>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+    st.write(_MAIN_PAGE_HTML, unsafe_allow_html=True)
     st.write("")
 # Management of the sidebar
 if RECOMMENDATION_PAGE or MAIN_PAGE:
@@ -157,11 +242,11 @@ if RECOMMENDATION_PAGE or MAIN_PAGE:
 # Management of History
 if st.session_state.get("user") and not GRAPH_VIZ:
     st.sidebar.write("History of your preferences:")
-    for (key, preference_value) in reversed(
-            st.session_state.user.get_preferences.items()):
-        if st.sidebar.button(st.session_state.raw_recipes.loc[key]
-                             [RECIPE_COLUMNS[0]] + "  \nRating: " +
-                             str(preference_value), key=key):
+    history = st.session_state.user.get_preferences_reversed
+    recipe_names = load_recipe_names()
+    for key, preference_value in history:
+        if st.sidebar.button(f"{recipe_names[key]}  \n"
+                             f"Rating: {preference_value}", key=key):
             st.session_state.last_recommended_index = key
             HISTORY = True
             RECOMMENDATION_PAGE = True
@@ -173,57 +258,27 @@ if RECOMMENDATION_PAGE:
     else:
         st.session_state.user.del_preferences(
             st.session_state.last_recommended_index)
-    st.write("""
-             <div style="text-align: center; font-size:20px">
-             Here is a recipe for you
-             (please feel free to expand the recipe's details) <br>
-             Let us know if you like it or not so that
-             we can recommend a better one next.  <br>
-             For that, click on the 'like' and 'dislike' buttons below:
-             </div>
-             """,
-             unsafe_allow_html=True)
-    st.title(
-        st.session_state.raw_recipes.loc[
-            st.session_state.last_recommended_index][RECIPE_COLUMNS[0]])
+    st.write(_RECOMMENDATION_HTML, unsafe_allow_html=True)
+    recipe_name, steps_text, ingredients_text = recipe_panel(
+        st.session_state.last_recommended_index)
+    st.title(recipe_name)
     col1, col2, col3 = st.columns(
         [1, 1, 1], gap="small", vertical_alignment="center")
     col1.button("❌", key="dislike", help="Dislike", use_container_width=True)
     col3.button("✅", key="like", help="Like", use_container_width=True)
-    try:
-        images = print_image(
-            st.session_state.raw_recipes.loc[
-                st.session_state.last_recommended_index]
-            [RECIPE_COLUMNS[0]], 1)[0]
-        col2.markdown(
-            f"""
-            <div style="text-align: center;">
-                <img src="{images}" style="height: 200px;
-                object-fit: cover; border-radius: 50%;
-                border: 2px solid #000;">
-            </div>
-            """,
-            unsafe_allow_html=True)
-    except ImageError as e:
-        col2.write(e)
+    images = cached_image(recipe_name)
+    if images is not None:
+        # Keyed, so that only this image gets the round frame of the style
+        col2.container(key="recipe_image").image(images, width=200)
+    else:
+        col2.write("No image found for this recipe")
     st.write("")
     col1, col2 = st.columns(2, gap="small")
-    steps, ingredients = fetch_recipe_details(
-        st.session_state.raw_recipes, st.session_state.last_recommended_index)
     exp = col1.expander("Recipe's steps")
-    exp.write('  \n'.join(steps))
+    exp.write(steps_text)
     exp2 = col2.expander("Recipe's ingredients")
-    exp2.write('  \n'.join(ingredients))
-    st.write(
-        """
-    <div style="text-align: center;">
-        <br><br><br><br>
-        Choosing a new type of dish will reset your recommendation algorithm
-        <br><br>
-    </div>
-    """,
-        unsafe_allow_html=True,
-    )
+    exp2.write(ingredients_text)
+    st.write(_RESET_WARNING_HTML, unsafe_allow_html=True)
 # Change of type of dish: all pages but explanation page
 if not GRAPH_VIZ:
     col1, col2 = st.columns(2)
@@ -233,21 +288,7 @@ if not GRAPH_VIZ:
 else:
     st.session_state.last_recommended_index = \
         st.session_state.user.recipe_suggestion()
-    st.write(
-        f"""
-        <div style="text-align: justify; font-size:20px; color:\
-        {COLORS['first_color']}; font-weight: bold">
-        Fooder is a food recommendation website based
-        on a nearest neighbors algorithm.
-        Next recipe is recommended in function of your nearest neighbors,
-        depending on you and the other users likes and dislikes.
-        Other users's preferences come from a dataset of recipes
-        leaked from Fooder.com. On this page you can see your adjency
-        graph with the users that are closest to you, as well as
-        the number of recipes they can still recommend to you.
-        <br><br>
-        </div>
-        """, unsafe_allow_html=True)
+    st.write(_EXPLANATION_HTML, unsafe_allow_html=True)
     st.sidebar.button("Back", key="back")
     col1, col2 = st.columns([2, 2], gap="small")
     try:
@@ -255,18 +296,7 @@ else:
             st.session_state.graph_type)
     except NoNeighborError as e:
         logging.info(e)
-        st.write(
-            """
-            <div style="text-align: center; font-size:30px">
-                <br><br><br><br>
-                You have not yet liked or disliked any recipe, <br>
-                or you have no near neighbors in the database
-                from your current preferences.
-                <br><br>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+        st.write(_NO_NEIGHBOR_HTML, unsafe_allow_html=True)
     else:
         visualize_graph(graph_to_plot)
         with open("webapp_food/graphs/neighbour.html", "r",
@@ -4,9 +4,14 @@ Module containing the User class for recipe recommendations.
 # Importation des librairies
 from __future__ import annotations
 from dataclasses import dataclass, field
-from webapp_food.utils import NoNeighborError
+from typing import ClassVar, NamedTuple
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from webapp_food.utils import NoNeighborError, write_atomically
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import networkx as nx
 import logging
 from webapp_food.settings import LIKE, DISLIKE, \
@@ -16,6 +21,45 @@ from webapp_food.settings import LIKE, DISLIKE, \
 logger = logging.getLogger(__name__)
 
 
+class InteractionArrays(NamedTuple):
+    """
+    Interactions dataset stored as a structure of contiguous arrays, sorted
+    by user (a CSR matrix of the ratings with users as rows).
+
+    Attributes
+    ----------
+    user_codes : np.ndarray
+        The user code (int32) of each interaction.
+    user_ids : np.ndarray
+        The sorted unique user IDs.
+    recipe_codes : np.ndarray
+        The recipe code (int32) of each interaction.
+    recipe_ids : np.ndarray
+        The sorted unique recipe IDs.
+    rates : np.ndarray
+        The rating (int8) of each interaction.
+    recipe_order : np.ndarray
+        Positions of the interactions sorted by recipe code.
+    recipe_indptr : np.ndarray
+        The interactions on the recipe of code `c` are
+        `recipe_order[recipe_indptr[c]:recipe_indptr[c + 1]]`.
+    popularity : np.ndarray
+        The number of interactions (int32) on each recipe.
+    user_indptr : np.ndarray
+        The interactions of the user of code `u` are the positions
+        `user_indptr[u]:user_indptr[u + 1]`.
+    """
+    user_codes: np.ndarray
+    user_ids: np.ndarray
+    recipe_codes: np.ndarray
+    recipe_ids: np.ndarray
+    rates: np.ndarray
+    recipe_order: np.ndarray
+    recipe_indptr: np.ndarray
+    popularity: np.ndarray
+    user_indptr: np.ndarray
+
+
 @dataclass
 class User:
     """
@@ -32,6 +76,19 @@ class User:
         where the keys are recipe IDs and the values are the ratings given
         (default: empty dictionary).
 
+    __preferences_ids : np.ndarray
+        Growable int32 buffer of the recipe IDs of the preferences.
+
+    __preferences_rates : np.ndarray
+        Growable int8 buffer of the ratings of the preferences.
+
+    __nb_preferences : int
+        Number of preferences stored in the buffers.
+
+    __suggestions : dict
+        Near neighbors and suggested recipe, keyed by the frozen
+        preferences they were computed from.
+
     __interactions_main : pd.DataFrame
         Dataset containing user-recipe interactions for main dishes
         (dynamically loaded).
@@ -40,8 +97,20 @@ class User:
         Dataset containing user-recipe interactions for desserts
         (dynamically loaded).
 
-    __near_neighbor : pd.DataFrame
-        DataFrame containing the user IDs of nearby users.
+    __interactions : pd.DataFrame
+        Dataset of the user's type of dish, bound at initialization.
+
+    __near_neighbor : pd.Index
+        User IDs of nearby users (empty until a suggestion is computed).
+
+    __interactions_arrays : InteractionArrays
+        Interactions for the current type of dish, stored as contiguous
+        arrays of user codes, recipe codes and ratings
+        (see `factorize_interactions`).
+
+    __neighbor_pivot : tuple
+        Near neighbors the ratings matrix was last built for, followed by
+        the result of `pivot_of_neighbors` (None until first built).
 
     Methods
     -------
@@ -64,6 +133,10 @@ class User:
         Calculates the absolute deviation between recipe ratings and
         existing interactions.
 
+    abs_deviation_np(recipes_rating: np.ndarray,
+    interactions_pivot: np.ndarray) -> np.ndarray
+        Same as `abs_deviation` on raw NumPy arrays, without labels.
+
     def percentile_filter(interactions_pivot: pd.DataFrame,
                           nb_filtered_rows_min: int=5,
                           nb_filtered_rows_max: int=100):
@@ -71,32 +144,70 @@ class User:
         the 10th percentile of a "dist" column, with constraints on
         the minimum and maximum number of rows.
 
+    smallest_indices(values: np.ndarray, k: int) -> np.ndarray
+        Returns the positions of the `k` smallest values of an array, using
+        a partial sort.
+
     load_datasets() -> None
         Loads datasets for main dishes and desserts, if not already loaded.
 
+    read_interactions(path: str) -> pd.DataFrame
+        Reads an interactions dataset, through a Parquet copy of the CSV.
+
+    factorize_interactions(interactions: pd.DataFrame) -> InteractionArrays
+        Factorizes the user and recipe IDs of an interactions dataset and
+        indexes it by recipe and by user, memoized at the class level.
+
+    rows_of_codes(order: np.ndarray | None, indptr: np.ndarray,
+                  codes: np.ndarray)
+                  -> tuple[np.ndarray, np.ndarray]
+        Gathers the interactions of the given codes from an index.
+
+    codes_of(sorted_ids: np.ndarray, ids: list) -> np.ndarray
+        Returns the position of each ID in an array of sorted unique IDs.
+
+    clear_cache() -> None
+        Empties the memoized factorizations.
+
     get_type_of_dish() -> str
         Returns the user's preferred type of dish.
 
     get_preferences() -> dict
         Returns the user's preferences dictionary.
 
+    get_preferences_arrays() -> tuple[np.ndarray, np.ndarray]
+        Returns the user's preferences as arrays of recipe IDs and ratings.
+
+    get_preferences_reversed() -> list[tuple[int, int]]
+        Returns the user's preferences, the most recent first.
+
     get_interactions() -> pd.DataFrame
         Returns the dataset of user-recipe interactions for the current type
         of dish.
 
-    get_near_neighbor() -> pd.DataFrame
-        Returns the DataFrame of near neighbors.
+    get_interactions_arrays() -> InteractionArrays
+        Returns the factorized interactions for the current type of dish.
+
+    get_near_neighbor() -> pd.Index
+        Returns the IDs of the near neighbors.
+
+    near_neighbor(recipes_id: list, distances: pd.DataFrame)
+                  -> tuple[pd.Index, pd.Series]
+        Selects close neighbor users based on their distances and sums their
+        ratings of the recipes not yet reviewed.
 
-    near_neighbor(recipes_id: list, recipes_rating: np.ndarray,
-                  interactions: pd.DataFrame,
-                  interactions_pivot_input: pd.DataFrame) -> pd.DataFrame
-    Selects close neighbor users based on their distances
-    and interactions.
+    neighbor_distances(recipes_id: list, recipes_rating: np.ndarray)
+                       -> pd.DataFrame
+        Computes the absolute distance to every user having rated one of the
+        new user's recipes, without building a pivot table.
 
     recipe_suggestion() -> int
         Suggests a recipe based on the user's preferences and existing
         interactions. If no preferences exist, a random recipe is suggested.
 
+    random_recipe(recipes_id: list) -> int
+        Draws a random recipe, weighted by its number of interactions.
+
     add_preferences(recipe_suggested: int, rating: int) -> None
         Adds a preference for a specific recipe with a given rating.
 
@@ -106,6 +217,15 @@ class User:
     get_graph(type: int) -> nx.MultiGraph
         Generates a user interaction graph based on preferences and recipes.
 
+    pivot_of_neighbors() -> tuple[np.ndarray, np.ndarray, np.ndarray]
+        Builds the ratings matrix of the near neighbors over the recipes
+        they rated, once per set of near neighbors.
+
+    batch_neighbor_data(ratings: np.ndarray, users_ratings: np.ndarray)
+                        -> np.ndarray
+        Counts the common likes, common dislikes and recipes to recommend of
+        each neighbor for a batch of users.
+
     get_neighbor_data(type: int) -> pd.DataFrame
         Analyzes interactions between the main user and their close neighbors
         to identify commonly liked recipes, commonly disliked recipes, and
@@ -138,8 +258,19 @@ class User:
         init=False, repr=False)
     __interactions_dessert: pd.DataFrame = field(
         init=False, repr=False)
-    __near_neighbor: pd.DataFrame = field(
+    __interactions: pd.DataFrame = field(
         init=False, repr=False)
+    __near_neighbor: pd.Index = field(
+        init=False, repr=False)
+    __interactions_arrays: InteractionArrays = field(
+        init=False, repr=False)
+    __preferences_ids: np.ndarray = field(init=False, repr=False)
+    __preferences_rates: np.ndarray = field(init=False, repr=False)
+    __nb_preferences: int = field(init=False, repr=False)
+    __suggestions: dict = field(init=False, repr=False)
+    __neighbor_pivot: tuple = field(init=False, repr=False)
+    # Factorized interactions, keyed by id() of the interactions DataFrame
+    _pivot_cache: ClassVar[dict] = {}
 
     # init
 
@@ -160,9 +291,14 @@ class User:
         ValueError
             If the dish type is invalid.
         """
-        logger.debug(f"Creating a new user for {type_of_dish} dishes")
+        logger.debug("Creating a new user for %s dishes", type_of_dish)
         self.__type_of_dish = type_of_dish
         self.__preferences = {}
+        # The preferences are mirrored in growable arrays for the
+        # computations, in the same order as the dictionary
+        self.__preferences_ids = np.empty(8, dtype=np.int32)
+        self.__preferences_rates = np.empty(8, dtype=np.int8)
+        self.__nb_preferences = 0
         # Test dish type validity
         self.validity_type_of_dish(self.get_type_of_dish)
         # Load the datasets only once to avoid unnecessary overhead.
@@ -171,8 +307,20 @@ class User:
         else:
             self.__interactions_main = df_main
             self.__interactions_dessert = df_dessert
-        # Initialise near neighbors at None
-        self.__near_neighbor = pd.DataFrame()
+        # The type of dish never changes, so its dataset is bound once
+        if self.get_type_of_dish == TYPE_OF_DISH[0]:
+            self.__interactions = self.__interactions_main
+        else:
+            self.__interactions = self.__interactions_dessert
+        # Keep the interactions of the type of dish as contiguous arrays
+        self.__interactions_arrays = self.factorize_interactions(
+            self.get_interactions)
+        # No near neighbors until a suggestion is computed
+        self.__near_neighbor = pd.Index([], dtype=np.int32)
+        # Suggestions from the near neighbors, keyed by preferences
+        self.__suggestions = {}
+        # Ratings matrix of the near neighbors, shared by the graph page
+        self.__neighbor_pivot = None
 
     # static methods
 
@@ -191,9 +339,9 @@ class User:
         ValueError
             If the dish type is neither "main" nor "dessert".
         """
-        logger.debug(f"Checking validity of type_of_dish={type_of_dish}")
+        logger.debug("Checking validity of type_of_dish=%s", type_of_dish)
         if type_of_dish not in TYPE_OF_DISH:
-            logger.info(f"Invalid type of dish: {type_of_dish}")
+            logger.info("Invalid type of dish: %s", type_of_dish)
             raise ValueError(f'The type of dish must be "main" or \
                              "dessert" only, and not "{
                              type_of_dish}".')
@@ -213,16 +361,25 @@ class User:
         -------
         pd.DataFrame
             A pivot table with user IDs as rows, recipe IDs as columns, and
-            ratings as values. Missing values are replaced with 0.
+            ratings as int8 values. Missing values are replaced with 0.
+
+        Notes
+        -----
+        The table is built by factorizing both ID columns into integer codes
+        and scattering the ratings into a zero-filled array, which avoids the
+        intermediate NaN-filled frame of `DataFrame.pivot` + `fillna`.
         """
         logger.debug("Pivoting DataFrame of interactions")
-        interactions_pivot = interactions_reduce.pivot(
-            index=USER_COLUMNS[0], columns=USER_COLUMNS[1],
-            values=USER_COLUMNS[2])
-        interactions_pivot = interactions_pivot.fillna(0)
-        interactions_pivot.columns.name = None
-        interactions_pivot.index.name = None
-        return interactions_pivot
+        user_codes, user_ids = pd.factorize(
+            interactions_reduce[USER_COLUMNS[0]].to_numpy(), sort=True)
+        recipe_codes, recipe_ids = pd.factorize(
+            interactions_reduce[USER_COLUMNS[1]].to_numpy(), sort=True)
+        interactions_pivot = np.zeros((len(user_ids), len(recipe_ids)),
+                                      dtype=np.int8)
+        interactions_pivot[user_codes, recipe_codes] = \
+            interactions_reduce[USER_COLUMNS[2]].to_numpy(dtype=np.int8)
+        return pd.DataFrame(interactions_pivot, index=user_ids,
+                            columns=recipe_ids)
 
     @staticmethod
     def abs_deviation(recipes_rating: np.ndarray,
@@ -248,9 +405,51 @@ class User:
         logger.debug(
             "Calculating absolute deviation between user \
             preferences and existing interactions")
-        interactions_abs = np.abs(
-            interactions_pivot-recipes_rating)
-        return interactions_abs
+        interactions_abs = interactions_pivot.to_numpy(dtype=np.int16,
+                                                       copy=True)
+        User.abs_deviation_np(recipes_rating, interactions_abs,
+                              out=interactions_abs)
+        return pd.DataFrame(interactions_abs.reshape(interactions_pivot.shape),
+                            index=interactions_pivot.index,
+                            columns=interactions_pivot.columns)
+
+    @staticmethod
+    def abs_deviation_np(recipes_rating: np.ndarray,
+                         interactions_pivot: np.ndarray,
+                         out: np.ndarray = None) -> np.ndarray:
+        """
+        Computes the absolute deviation on raw arrays, without labels.
+
+        Parameters
+        ----------
+        recipes_rating : np.ndarray
+            Preferences assigned to recipes by the new user (1D or 2D array
+            with one row).
+        interactions_pivot : np.ndarray
+            2D array of ratings, one row per user and one column per recipe,
+            in the same recipe order as `recipes_rating`.
+        out : np.ndarray, optional
+            int16 array of the same shape as `interactions_pivot` in which
+            the result is written. It may be `interactions_pivot` itself.
+            A new array is allocated if not given.
+
+        Returns
+        -------
+        np.ndarray
+            int16 array of shape (n_users, n_recipes) with the absolute
+            deviations.
+
+        Notes
+        -----
+        - Ratings are integers in {-1, 0, 1}: the difference is computed in
+          int16 so that it cannot wrap around.
+        - Both steps run in place in the output buffer, so no temporary
+          array of the size of the pivot is allocated.
+        """
+        recipes_rating = np.asarray(recipes_rating, dtype=np.int8)
+        out = np.subtract(interactions_pivot, recipes_rating.reshape(-1),
+                          out=out, dtype=np.int16)
+        return np.abs(out, out=out)
 
     @staticmethod
     def percentile_filter(interactions_pivot: pd.DataFrame,
@@ -307,9 +506,12 @@ class User:
         2
         """
         logger.debug("Applying percentile filter to interactions")
-        percentile_10 = interactions_pivot['dist'].quantile(0.1)
-        filter_percentile_10 = interactions_pivot['dist'] <= percentile_10
-        nb_filtered_rows = (filter_percentile_10).sum()
+        dist = interactions_pivot['dist'].to_numpy()
+        if dist.size:
+            filter_percentile_10 = dist <= np.quantile(dist, 0.1)
+        else:
+            filter_percentile_10 = np.zeros(0, dtype=bool)
+        nb_filtered_rows = int(filter_percentile_10.sum())
         if nb_filtered_rows < nb_filtered_rows_min:
             nb_filtered_rows = nb_filtered_rows_min
         elif nb_filtered_rows > nb_filtered_rows_max:
@@ -318,6 +520,42 @@ class User:
             interactions_pivot = interactions_pivot[filter_percentile_10]
         return interactions_pivot, nb_filtered_rows
 
+    @staticmethod
+    def smallest_indices(values: np.ndarray, k: int) -> np.ndarray:
+        """
+        Returns the positions of the `k` smallest values of an array.
+
+        Uses a partial sort (`np.partition`), which is linear in the size
+        of the array, instead of sorting it entirely. Ties are broken by
+        position, as `np.argsort(values, kind="stable")[:k]` would.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            1D array of values.
+        k : int
+            Number of positions to return. All the positions are returned
+            if `k` is greater than the size of the array.
+
+        Returns
+        -------
+        np.ndarray
+            Positions of the `k` smallest values, in increasing order of
+            value.
+        """
+        if k >= len(values):
+            indices = np.arange(len(values))
+        elif k <= 0:
+            return np.zeros(0, dtype=np.intp)
+        else:
+            # Every value below the k-th smallest one is kept, then the
+            # first positions equal to it
+            threshold = np.partition(values, k - 1)[k - 1]
+            below = np.flatnonzero(values < threshold)
+            ties = np.flatnonzero(values == threshold)[:k - len(below)]
+            indices = np.sort(np.concatenate([below, ties]))
+        return indices[np.argsort(values[indices], kind="stable")]
+
     # class methods
 
     @classmethod
@@ -333,12 +571,187 @@ class User:
 
         """
         logger.debug("Loading datasets for main dishes and desserts")
-        if not hasattr(cls, "__interactions_main") or \
-                not hasattr(cls, "__interactions_dessert"):
-            cls.__interactions_main = pd.read_csv(
-                USER_MAIN_DF, sep=',')
-            cls.__interactions_dessert = pd.read_csv(
-                USER_DESSERT_DF, sep=',')
+        # The names are not mangled inside strings
+        if getattr(cls, "_User__interactions_main", None) is None or \
+                getattr(cls, "_User__interactions_dessert", None) is None:
+            # The pyarrow engine releases the GIL, so both files are read
+            # concurrently.
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                main, dessert = executor.map(
+                    cls.read_interactions, [USER_MAIN_DF, USER_DESSERT_DF])
+            cls.__interactions_main = main
+            cls.__interactions_dessert = dessert
+
+    @staticmethod
+    def read_interactions(path: str) -> pd.DataFrame:
+        """
+        Reads an interactions dataset, through a Parquet copy of the CSV.
+
+        The first read parses the CSV and saves its columns next to it as
+        Parquet, which is then read directly by the next processes as long
+        as it is newer than the CSV. An unreadable Parquet copy is ignored
+        and rewritten from the CSV.
+
+        Parameters
+        ----------
+        path : str
+            Path of the CSV file.
+
+        Returns
+        -------
+        pd.DataFrame
+            The user ID and recipe ID (int32) and rating (int8) columns of
+            the dataset.
+        """
+        csv_path = Path(path)
+        parquet_path = csv_path.with_suffix('.parquet')
+        if parquet_path.exists() and \
+                parquet_path.stat().st_mtime >= csv_path.stat().st_mtime:
+            logger.debug("Reading interactions from %s", parquet_path)
+            try:
+                return pd.read_parquet(parquet_path, engine='pyarrow')
+            except (pa.ArrowInvalid, OSError) as exc:
+                logger.warning("Could not read %s: %s", parquet_path, exc)
+        logger.debug("Reading interactions from %s", csv_path)
+        # Only parse the columns used by the recommendation, the saved
+        # index column of the preprocessing is skipped.
+        interactions = pd.read_csv(csv_path, sep=',', usecols=USER_COLUMNS,
+                                   engine='pyarrow')
+        # The IDs fit in 32 bits and the ratings are -1 or 1
+        interactions = interactions.astype({USER_COLUMNS[0]: np.int32,
+                                            USER_COLUMNS[1]: np.int32,
+                                            USER_COLUMNS[2]: np.int8})
+        try:
+            # Written aside then moved, so that no other process can read a
+            # partial file
+            write_atomically(parquet_path, lambda tmp_path:
+                             interactions.to_parquet(tmp_path,
+                                                     engine='pyarrow',
+                                                     index=False))
+        except OSError as exc:
+            logger.warning("Could not save %s: %s", parquet_path, exc)
+        return interactions
+
+    @classmethod
+    def factorize_interactions(
+            cls, interactions: pd.DataFrame) -> InteractionArrays:
+        """
+        Factorizes the user and recipe ID columns of an interactions dataset
+        and indexes the interactions by recipe and by user.
+
+        The interactions datasets never change during a session, so the
+        result is memoized at the class level and reused by every call to
+        `recipe_suggestion`.
+
+        Parameters
+        ----------
+        interactions : pd.DataFrame
+            DataFrame containing user-recipe interactions.
+
+        Returns
+        -------
+        InteractionArrays
+            The interactions as contiguous arrays of user codes, recipe codes
+            and ratings, with an index of the interactions of each recipe.
+        """
+        cached = cls._pivot_cache.get(id(interactions))
+        if cached is not None and cached[0]() is interactions:
+            return cached[1]
+        logger.debug("Factorizing interactions dataset")
+        user_codes, user_ids = pd.factorize(
+            interactions[USER_COLUMNS[0]].to_numpy(), sort=True)
+        recipe_codes, recipe_ids = pd.factorize(
+            interactions[USER_COLUMNS[1]].to_numpy(), sort=True)
+        # Sort the interactions by user, so that the interactions of a user
+        # are contiguous
+        by_user = np.argsort(user_codes, kind="stable")
+        user_codes = user_codes[by_user].astype(np.int32)
+        recipe_codes = recipe_codes[by_user].astype(np.int32)
+        rates = interactions[USER_COLUMNS[2]].to_numpy(dtype=np.int8)[by_user]
+        popularity = np.bincount(
+            recipe_codes, minlength=len(recipe_ids)).astype(np.int32)
+        recipe_indptr = np.zeros(len(recipe_ids) + 1, dtype=np.intp)
+        np.cumsum(popularity, out=recipe_indptr[1:])
+        user_indptr = np.zeros(len(user_ids) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(user_codes, minlength=len(user_ids)),
+                  out=user_indptr[1:])
+        factorized = InteractionArrays(
+            user_codes, user_ids, recipe_codes, recipe_ids, rates,
+            np.argsort(recipe_codes, kind="stable"), recipe_indptr,
+            popularity, user_indptr)
+        # Only hold a weak reference, so that the entry is dropped together
+        # with the interactions DataFrame it was computed from.
+        key = id(interactions)
+        cls._pivot_cache[key] = (
+            weakref.ref(interactions,
+                        lambda _: cls._pivot_cache.pop(key, None)),
+            factorized)
+        return factorized
+
+    @staticmethod
+    def rows_of_codes(order: np.ndarray | None, indptr: np.ndarray,
+                      codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gathers the interactions of the given codes from an index built by
+        `factorize_interactions`.
+
+        Parameters
+        ----------
+        order : np.ndarray or None
+            Positions of the interactions sorted by code, None if the
+            interactions are already sorted by code.
+        indptr : np.ndarray
+            Boundaries of each code in `order`.
+        codes : np.ndarray
+            Codes to gather.
+
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - np.ndarray: The positions of the interactions of the codes.
+            - np.ndarray: For each of them, its index in `codes`.
+        """
+        starts = indptr[codes]
+        lengths = indptr[np.asarray(codes) + 1] - starts
+        which = np.repeat(np.arange(len(lengths)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths)
+        positions = starts[which] + offsets
+        if order is None:
+            return positions, which
+        return order[positions], which
+
+    @staticmethod
+    def codes_of(sorted_ids: np.ndarray, ids: list) -> np.ndarray:
+        """
+        Returns the position of each ID in an array of sorted unique IDs.
+
+        Parameters
+        ----------
+        sorted_ids : np.ndarray
+            Sorted unique IDs, as returned by `factorize_interactions`.
+        ids : list
+            IDs to look up.
+
+        Returns
+        -------
+        np.ndarray
+            The code of each ID, -1 for the IDs not in `sorted_ids`.
+        """
+        codes = np.searchsorted(sorted_ids, ids)
+        if len(sorted_ids) == 0:
+            return np.full(len(codes), -1)
+        found = sorted_ids[np.minimum(codes, len(sorted_ids) - 1)] == ids
+        return np.where(found, codes, -1)
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """
+        Empties the memoized factorizations of the interactions datasets.
+        """
+        logger.debug("Clearing pivot cache")
+        cls._pivot_cache.clear()
 
     # Getters
 
@@ -368,6 +781,39 @@ class User:
         logger.debug("Getting preferences for user")
         return self.__preferences
 
+    @property
+    def get_preferences_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the user's preferences as arrays.
+
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - np.ndarray: The recipe IDs (int32), in the order of
+              `get_preferences`.
+            - np.ndarray: The ratings (int8) of these recipes.
+        """
+        logger.debug("Getting preferences arrays for user")
+        nb_preferences = self.__nb_preferences
+        return (self.__preferences_ids[:nb_preferences],
+                self.__preferences_rates[:nb_preferences])
+
+    @property
+    def get_preferences_reversed(self) -> list[tuple[int, int]]:
+        """
+        Returns the user's preferences, the most recent first.
+
+        Returns
+        -------
+        list of tuple
+            The (recipe ID, rating) pairs, read backwards from the
+            preferences arrays.
+        """
+        logger.debug("Getting reversed preferences for user")
+        recipes, rates = self.get_preferences_arrays
+        return list(zip(recipes[::-1].tolist(), rates[::-1].tolist()))
+
     @property
     def get_interactions(self) -> pd.DataFrame:
         """
@@ -379,73 +825,135 @@ class User:
             Dataset of interactions.
         """
         logger.debug("Getting interactions dataset")
-        if self.get_type_of_dish == TYPE_OF_DISH[0]:
-            interactions = self.__interactions_main
-        elif self.get_type_of_dish == TYPE_OF_DISH[1]:
-            interactions = self.__interactions_dessert
+        return self.__interactions
 
-        return interactions
+    @property
+    def get_interactions_arrays(self) -> InteractionArrays:
+        """
+        Returns the interactions for the current type of dish as arrays.
+
+        Returns
+        -------
+        InteractionArrays
+            The factorized interactions, see `factorize_interactions`.
+        """
+        logger.debug("Getting interactions arrays")
+        return self.__interactions_arrays
 
     @property
-    def get_near_neighbor(self) -> pd.DataFrame:
+    def get_near_neighbor(self) -> pd.Index:
         """
-        Returns the DataFrame of near neighbors.
+        Returns the IDs of the near neighbors.
 
         Returns
         -------
-        pd.DataFrame
-            DataFrame containing the user IDs of nearby users.
+        pd.Index
+            User IDs of nearby users, empty before the first suggestion.
         """
         logger.debug("Getting near neighbors")
         return self.__near_neighbor
 
     # methods
 
-    def near_neighbor(self, recipes_id: list, recipes_rating: np.ndarray,
-                      interactions: pd.DataFrame,
-                      interactions_pivot_input: pd.DataFrame) -> pd.DataFrame:
+    def neighbor_distances(self, recipes_id: list,
+                           recipes_rating: np.ndarray) -> pd.DataFrame:
         """
-        Selects nearby users based on distances and their interactions.
+        Computes the absolute distance between the new user and every user
+        having rated at least one of the recipes reviewed by the new user.
+
+        The distance is accumulated directly over the interactions on
+        `recipes_id`, from the memoized factorization, without building the
+        users x recipes pivot table: a recipe not rated by a user contributes
+        `|rating|`, a rated one `|rating - user rating|`.
 
         Parameters
         ----------
         recipes_id : list
             List of recipe IDs already reviewed by the new user.
         recipes_rating : np.ndarray
-            Preferences assigned to recipes by the new user (1D array).
-        interactions : pd.DataFrame
-            DataFrame containing user-recipe interactions.
-        interactions_pivot_input : pd.DataFrame
-            Pivot table containing user distances and recipe interactions.
+            Preferences assigned to `recipes_id` by the new user, in the same
+            order.
 
         Returns
         -------
         pd.DataFrame
-            Filtered interactions from nearby users for recipes not reviewed
-            by the new user.
+            DataFrame indexed by user ID with a "dist" column. Users who rated
+            every recipe in the opposite way are excluded.
+        """
+        logger.debug("Computing distances to the users")
+        arrays = self.get_interactions_arrays
+        recipes_rating = np.asarray(recipes_rating,
+                                    dtype=np.int8).reshape(-1)
+        codes = self.codes_of(arrays.recipe_ids, recipes_id)
+        known = np.flatnonzero(codes >= 0)
+        # Only the interactions on the reviewed recipes are visited
+        rows, which = self.rows_of_codes(
+            arrays.recipe_order, arrays.recipe_indptr, codes[known])
+        candidates, users = np.unique(arrays.user_codes[rows],
+                                      return_inverse=True)
+        rating = recipes_rating[known[which]]
+        # The weighted sums are whole numbers at most 2 * len(recipes_id),
+        # so they are stored back as int32
+        dist = np.abs(recipes_rating).sum(dtype=np.int32) + np.bincount(
+            users,
+            weights=np.abs(arrays.rates[rows] - rating) - np.abs(rating),
+            minlength=len(candidates)).astype(np.int32)
+        # A deviation of 2 on every recipe: the user is the exact opposite
+        keep = dist != 2 * len(recipes_rating)
+        return pd.DataFrame({"dist": dist[keep]},
+                            index=arrays.user_ids[candidates[keep]])
+
+    def near_neighbor(self, recipes_id: list,
+                      distances: pd.DataFrame) -> tuple[pd.Index, pd.Series]:
+        """
+        Selects nearby users based on distances and sums their ratings of
+        the recipes not reviewed by the new user.
+
+        Parameters
+        ----------
+        recipes_id : list
+            List of recipe IDs already reviewed by the new user.
+        distances : pd.DataFrame
+            DataFrame indexed by user ID with a "dist" column, as returned by
+            `neighbor_distances`.
+
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - pd.Index: IDs of the nearby users having rated recipes not
+              reviewed by the new user.
+            - pd.Series: Sum of their ratings, indexed by the sorted IDs of
+              these recipes.
         """
         logger.debug(
             "Selecting near neighbors based on distance and interactions")
-        interactions_abs = self.abs_deviation(recipes_rating,
-                                              interactions_pivot_input)
-        interactions_pivot_input["dist"] = interactions_abs.sum(axis=1)
-        interactions_pivot_input = interactions_pivot_input[
-            ~np.array(np.all(interactions_abs == 2, axis=1))]
-        interactions_pivot_input, nb_filtered_rows = self.percentile_filter(
-            interactions_pivot_input)
-        user_prox_id = interactions_pivot_input.sort_values(
-            "dist").head(nb_filtered_rows).index
-        # sys.exit('flag')
-        interactions_prox = interactions[interactions[USER_COLUMNS[0]].isin(
-            user_prox_id)]
-        interactions_prox = interactions_prox[
-            ~interactions_prox[USER_COLUMNS[1]].isin(recipes_id)]
-        interactions_pivot_output = User.pivot_table_of_df(interactions_prox)
-        interactions_pivot_output = interactions_pivot_output.reindex(
-            user_prox_id)
-        user_prox_id = np.unique(interactions_prox[USER_COLUMNS[0]])
-        interactions_selection = interactions_pivot_output.loc[user_prox_id]
-        return interactions_selection
+        distances, nb_filtered_rows = self.percentile_filter(distances)
+        user_prox_id = distances.index[self.smallest_indices(
+            distances["dist"].to_numpy(), nb_filtered_rows)]
+        arrays = self.get_interactions_arrays
+        # Only the interactions of the near neighbors are visited
+        user_prox_codes = self.codes_of(arrays.user_ids, user_prox_id)
+        positions, which = self.rows_of_codes(
+            None, arrays.user_indptr, user_prox_codes)
+        # Drop the recipes already reviewed
+        reviewed = np.zeros(len(arrays.recipe_ids), dtype=bool)
+        codes = self.codes_of(arrays.recipe_ids, recipes_id)
+        reviewed[codes[codes >= 0]] = True
+        not_reviewed = ~reviewed[arrays.recipe_codes[positions]]
+        positions = positions[not_reviewed]
+        # Near neighbors left with at least one recipe to suggest
+        neighbors = arrays.user_ids[np.sort(user_prox_codes[np.flatnonzero(
+            np.bincount(which[not_reviewed],
+                        minlength=len(user_prox_codes)))])]
+        # Aggregate the ratings per recipe, without a dense pivot
+        columns_recipes, columns = np.unique(
+            arrays.recipe_codes[positions], return_inverse=True)
+        scores = np.bincount(columns, weights=arrays.rates[positions],
+                             minlength=len(columns_recipes))
+        return (pd.Index(neighbors),
+                pd.Series(scores.astype(np.int64),
+                          index=arrays.recipe_ids[columns_recipes]))
 
     def recipe_suggestion(self) -> int:
         """
@@ -461,47 +969,82 @@ class User:
         -----
         - If the new user has no preferences, a random recipe is suggested.
         - The suggestion is based on the similarity of nearby users.
+        - The suggestions from nearby users are memoized per preferences,
+          random suggestions are not.
 
         """
         logger.debug("Proposing a recipe suggestion for user")
-        interactions = self.get_interactions
-        preferences = self.get_preferences
-        if len(preferences) == 0:
+        recipes_id, recipes_rating = self.get_preferences_arrays
+        if len(recipes_id) == 0:
             logger.info('user new historic is empty')
-            recipe_suggested = interactions[
-                USER_COLUMNS[1]].sample(n=1).iloc[0]
+            recipe_suggested = self.random_recipe([])
         else:
-            recipes_id = list(preferences.keys())
-            recipes_rating = np.array(
-                list(preferences.values())).reshape(1, -1)
-            interactions_reduce = interactions[
-                interactions[USER_COLUMNS[1]].isin(
-                    recipes_id)]
-            interactions_pivot = self.pivot_table_of_df(interactions_reduce)
-            interactions_selection = self.near_neighbor(recipes_id,
-                                                        recipes_rating,
-                                                        interactions,
-                                                        interactions_pivot)
-            self.__near_neighbor = interactions_selection.index
-            if interactions_selection.empty:
-                # drop recipes already in preferences
-                interactions_selection = interactions[
-                    ~interactions[USER_COLUMNS[1]].isin(recipes_id)]
-                if interactions_selection.empty:
-                    logger.info('No more recipes to suggest from the dataset')
-                    raise ValueError('No more recipes to suggest.')
-                else:
-                    logger.info(
-                        'No more recipes to suggest from the \
-                        user preferences, suggesting a random recipe')
-                    recipe_suggested = \
-                        interactions_selection[
-                            USER_COLUMNS[1]].sample(n=1).iloc[0]
+            # Streamlit reruns the page with unchanged preferences, the
+            # suggestion from the near neighbors is then reused
+            key = frozenset(self.get_preferences.items())
+            if key in self.__suggestions:
+                logger.debug("Reusing the suggestion for these preferences")
+                self.__near_neighbor, recipe_suggested = \
+                    self.__suggestions[key]
+                return recipe_suggested
+            recipes_rating = recipes_rating.reshape(1, -1)
+            distances = self.neighbor_distances(recipes_id, recipes_rating)
+            self.__near_neighbor, scores = self.near_neighbor(recipes_id,
+                                                              distances)
+            if scores.empty:
+                logger.info(
+                    'No more recipes to suggest from the \
+                    user preferences, suggesting a random recipe')
+                recipe_suggested = self.random_recipe(recipes_id)
             else:
+                # First best score, as idxmax, without the label lookup
                 recipe_suggested = int(
-                    interactions_selection.sum(axis=0).idxmax())
+                    scores.index[np.argmax(scores.to_numpy())])
+                if len(self.__suggestions) >= 512:
+                    # Forget the oldest suggestion
+                    del self.__suggestions[next(iter(self.__suggestions))]
+                self.__suggestions[key] = (self.__near_neighbor,
+                                           recipe_suggested)
         return recipe_suggested
 
+    def random_recipe(self, recipes_id: list) -> int:
+        """
+        Draws a random recipe, weighted by its number of interactions.
+
+        Parameters
+        ----------
+        recipes_id : list
+            IDs of the recipes that must not be drawn.
+
+        Returns
+        -------
+        int
+            Drawn recipe ID.
+
+        Raises
+        ------
+        ValueError
+            If every recipe of the dataset is excluded.
+        """
+        arrays = self.get_interactions_arrays
+        # drop recipes already in preferences, looked up by binary
+        # search in the sorted recipe IDs
+        codes = self.codes_of(arrays.recipe_ids, recipes_id)
+        excluded = np.unique(codes[codes >= 0])
+        total = arrays.recipe_indptr[-1] - arrays.popularity[excluded].sum()
+        if total == 0:
+            logger.info('No more recipes to suggest from the dataset')
+            raise ValueError('No more recipes to suggest.')
+        # Draw an interaction among the ones of the recipes left, then skip
+        # the interactions of the excluded recipes before it. The recipe is
+        # found by binary search in the cumulated popularity.
+        drawn = np.random.randint(total)
+        for code in excluded:
+            if drawn >= arrays.recipe_indptr[code]:
+                drawn += arrays.popularity[code]
+        code = np.searchsorted(arrays.recipe_indptr, drawn, side='right') - 1
+        return int(arrays.recipe_ids[code])
+
     def add_preferences(self, recipe_suggested: int, rating: int) -> None:
         """
         Adds a new preference for a specific recipe.
@@ -513,8 +1056,22 @@ class User:
         rating : int
             The rating assigned to the recipe.
         """
-        logger.debug(f"Adding a new preference for recipe {
-                     recipe_suggested} with rating {rating}")
+        logger.debug("Adding a new preference for recipe %s with rating %s",
+                     recipe_suggested, rating)
+        if recipe_suggested in self.__preferences:
+            position = np.flatnonzero(
+                self.get_preferences_arrays[0] == recipe_suggested)[0]
+        else:
+            position = self.__nb_preferences
+            if position == len(self.__preferences_ids):
+                # Double the capacity of the arrays when they are full
+                self.__preferences_ids = np.resize(
+                    self.__preferences_ids, 2 * position)
+                self.__preferences_rates = np.resize(
+                    self.__preferences_rates, 2 * position)
+            self.__nb_preferences += 1
+        self.__preferences_ids[position] = recipe_suggested
+        self.__preferences_rates[position] = rating
         self.__preferences[recipe_suggested] = rating
 
     def del_preferences(self, recipe_deleted: int) -> None:
@@ -531,11 +1088,19 @@ class User:
         KeyError
             If the recipe ID does not exist in the user's preferences.
         """
-        logger.debug(f"Deleting preference for recipe {recipe_deleted}")
+        logger.debug("Deleting preference for recipe %s", recipe_deleted)
         if recipe_deleted in self.get_preferences:
             del self.__preferences[recipe_deleted]
+            position = np.flatnonzero(
+                self.get_preferences_arrays[0] == recipe_deleted)[0]
+            last = self.__nb_preferences
+            self.__preferences_ids[position:last - 1] = \
+                self.__preferences_ids[position + 1:last]
+            self.__preferences_rates[position:last - 1] = \
+                self.__preferences_rates[position + 1:last]
+            self.__nb_preferences -= 1
         else:
-            logger.info(f'Recipe ID {recipe_deleted} not in user preferences')
+            logger.info('Recipe ID %s not in user preferences', recipe_deleted)
             raise KeyError(
                 f'The recipe ID {recipe_deleted}\
                 is not in the user preferences.')
@@ -569,53 +1134,108 @@ class User:
         if near_neighbor.empty:
             logger.warning("No neighbor found")
             raise NoNeighborError("No neighbor found")
-        recipe_ids = [recipe_id for recipe_id,
-                      rate in self.__preferences.items() if rate == type]
-        interactions = self.get_interactions
-        interactions = self.pivot_table_of_df(
-            interactions.loc[
-                interactions[USER_COLUMNS[0]].isin(near_neighbor)])
-        missing_recipes = set(recipe_ids) - set(interactions.columns)
-        for recipe in missing_recipes:
-            interactions[recipe] = 0
+        preferences_ids, preferences_rates = self.get_preferences_arrays
+        recipe_ids = preferences_ids[preferences_rates == type]
+        neighbors, recipes, ratings = self.pivot_of_neighbors()
+        columns = np.union1d(recipes, recipe_ids)
+        # Row 0 is you, then a row per neighbor: True where rated `type`
+        rated = np.zeros((len(neighbors) + 1, len(columns)), dtype=bool)
+        rated[0, np.searchsorted(columns, recipe_ids)] = True
+        rated[1:, np.searchsorted(columns, recipes)] = ratings == type
+
+        # Only the neighbors sharing a rating with you are kept
+        kept = rated[:, rated[0]].any(axis=1)
+        nodes = ["you"] + [f"user {neighbor}"
+                           for neighbor in neighbors[kept[1:]]]
+        rated = rated[kept]
+        # Every pair of users, then the recipes rated `type` by both
+        first, second = np.triu_indices(len(nodes), k=1)
+        edge_columns, edge_pairs = np.nonzero(
+            (rated[first] & rated[second]).T)
+        nodes = np.array(nodes)
+        edges = zip(nodes[first[edge_pairs]].tolist(),
+                    nodes[second[edge_pairs]].tolist(),
+                    columns[edge_columns].astype(str).tolist())
 
         graph = nx.MultiGraph()
+        graph.add_nodes_from(nodes.tolist())
+        graph.add_edges_from(edges)
+        return graph
 
-        user = pd.Series(0, index=interactions.columns)
-        user[recipe_ids] = type
-        interactions = pd.concat(
-            [pd.DataFrame([user], index=[0]), interactions])
-
-        list_user = (interactions.index).to_list()
-        graph.add_nodes_from(
-            ["user " + str(neighbor) for neighbor in list_user])
-
-        while list_user:
-            for user in range(1, len(list_user)):
-                interactions_reduced = interactions.loc[
-                    [list_user[0], list_user[user]]]
-                interactions_filtered = interactions_reduced.loc[
-                    :, (interactions_reduced == type).any(axis=0)]
-                interactions_filtered = interactions_filtered.loc[
-                    :, (interactions_reduced != 0).any(axis=0)]
-                dist = self.abs_deviation(
-                    interactions_filtered.loc[list_user[0]],
-                    interactions_filtered.loc[list_user[user]])
-                recipes_with_edge = dist[dist == 0].index.to_list()
-                for recipe in recipes_with_edge:
-                    graph.add_edge(f"user {list_user[0]}",
-                                   f"user {list_user[user]}", key=f"{recipe}")
-            list_user = list_user[1:]
-
-        graph = nx.relabel_nodes(graph, {"user 0": "you"}, copy=False)
-
-        connected_nodes = set(graph.neighbors("you"))
-        connected_nodes.add("you")
-        unconnected_nodes = [
-            node for node in graph.nodes if node not in connected_nodes]
-        graph.remove_nodes_from(unconnected_nodes)
+    def pivot_of_neighbors(self) -> tuple[np.ndarray, np.ndarray,
+                                          np.ndarray]:
+        """
+        Builds the ratings matrix of the near neighbors over the recipes
+        they rated.
 
-        return graph
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - np.ndarray: The sorted IDs of the near neighbors (rows).
+            - np.ndarray: The sorted IDs of the recipes they rated (columns).
+            - np.ndarray: The int8 ratings matrix, 0 where not rated.
+
+        Notes
+        -----
+        The matrix is kept until the near neighbors change, so that
+        `get_graph` and `get_neighbor_data` build it only once per
+        suggestion.
+        """
+        near_neighbor = self.get_near_neighbor
+        if self.__neighbor_pivot is not None and \
+                self.__neighbor_pivot[0] is near_neighbor:
+            return self.__neighbor_pivot[1:]
+        logger.debug("Pivoting interactions of the near neighbors")
+        arrays = self.get_interactions_arrays
+        positions, _ = self.rows_of_codes(
+            None, arrays.user_indptr,
+            self.codes_of(arrays.user_ids, near_neighbor))
+        rows_users, rows = np.unique(arrays.user_codes[positions],
+                                     return_inverse=True)
+        columns_recipes, columns = np.unique(
+            arrays.recipe_codes[positions], return_inverse=True)
+        ratings = np.zeros((len(rows_users), len(columns_recipes)),
+                           dtype=np.int8)
+        ratings[rows, columns] = arrays.rates[positions]
+        self.__neighbor_pivot = (near_neighbor, arrays.user_ids[rows_users],
+                                 arrays.recipe_ids[columns_recipes], ratings)
+        return self.__neighbor_pivot[1:]
+
+    @staticmethod
+    def batch_neighbor_data(ratings: np.ndarray,
+                            users_ratings: np.ndarray) -> np.ndarray:
+        """
+        Counts, for a batch of users, the common likes, the common dislikes
+        and the recipes to recommend of each neighbor.
+
+        Parameters
+        ----------
+        ratings : np.ndarray
+            Ratings of the neighbors, of shape (n_neighbors, n_recipes).
+        users_ratings : np.ndarray
+            Ratings of the users on the same recipes, of shape
+            (n_users, n_recipes), 0 where a recipe is not rated.
+
+        Returns
+        -------
+        np.ndarray
+            Counts of shape (n_users, n_neighbors, 3), in the order of
+            `NEIGHBOR_DATA`.
+        """
+        # int32, so that the products accumulate without overflow
+        neighbor_likes = (ratings == LIKE).astype(np.int32)
+        neighbor_dislikes = (ratings == DISLIKE).astype(np.int32)
+        users_ratings = np.asarray(users_ratings)
+        common_likes = np.einsum(
+            'ur,br->bu', neighbor_likes,
+            (users_ratings == LIKE).astype(np.int32))
+        common_dislikes = np.einsum(
+            'ur,br->bu', neighbor_dislikes,
+            (users_ratings == DISLIKE).astype(np.int32))
+        to_recommend = neighbor_likes.sum(axis=1) - common_likes
+        return np.stack([common_likes, common_dislikes, to_recommend],
+                        axis=-1)
 
     def get_neighbor_data(self, type):
         """
@@ -633,31 +1253,16 @@ class User:
         """
         logger.debug("Getting neighbors data")
 
-        liked = [recipe_id for recipe_id,
-                 rate in self.get_preferences.items() if rate == LIKE]
-        disliked = [recipe_id for recipe_id,
-                    rate in self.get_preferences.items() if rate == DISLIKE]
-        near_neighbor = self.get_near_neighbor
+        neighbors, recipes, ratings = self.pivot_of_neighbors()
+        # Ratings of the user over the columns of the neighbors' pivot
+        user_ratings = np.zeros(len(recipes), dtype=np.int8)
+        preferences_ids, preferences_rates = self.get_preferences_arrays
+        codes = self.codes_of(recipes, preferences_ids)
+        known = codes >= 0
+        user_ratings[codes[known]] = preferences_rates[known]
 
-        interactions = self.get_interactions
-        interactions = self.pivot_table_of_df(
-            interactions.loc[
-                interactions[USER_COLUMNS[0]].isin(near_neighbor)])
-        missing_recipes = set(liked+disliked) - set(interactions.columns)
-        for recipe in missing_recipes:
-            interactions[recipe] = 0
-
-        common_likes = (interactions[liked] == LIKE).sum(axis=1)
-        common_dislikes = (interactions[disliked] == DISLIKE).sum(axis=1)
-
-        remaining_recipes = interactions.drop(columns=liked)
-        to_recommend = (remaining_recipes == LIKE).sum(axis=1)
-
-        df = pd.DataFrame({
-            NEIGHBOR_DATA[0]: common_likes,
-            NEIGHBOR_DATA[1]: common_dislikes,
-            NEIGHBOR_DATA[2]: to_recommend
-        })
+        counts = self.batch_neighbor_data(ratings, user_ratings[None])[0]
+        df = pd.DataFrame(counts, columns=NEIGHBOR_DATA, index=neighbors)
 
         df = df.sort_values(
             by=(NEIGHBOR_DATA[0] if type == LIKE else NEIGHBOR_DATA[1]),
@@ -2,6 +2,7 @@
 This module contains utility functions for the `webapp_food` module.
 
 The functions include:
+- Reading the recipes dataset through an Arrow IPC copy.
 - Searching for recipe images on Google.
 - Transforming graphs from NetworkX to PyVis.
 - Interacting between the app and the User class.
@@ -9,13 +10,19 @@ The functions include:
 """
 from __future__ import annotations
 from ast import literal_eval
+from pathlib import Path
+import os
 import re
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import logging
 from pyvis.network import Network
 from webapp_food.settings import RECIPE_COLUMNS, COLORS
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable
 
 if TYPE_CHECKING:
     from webapp_food.user_fooder import User
@@ -25,6 +32,9 @@ if TYPE_CHECKING:
 # use the requests library to search for images on Google
 logger = logging.getLogger(__name__)
 
+# Only the image tags of the search results are parsed
+IMG_STRAINER = SoupStrainer('img', {'src': re.compile('gstatic.com')})
+
 
 class ImageError(Exception):
     """
@@ -38,6 +48,85 @@ class NoNeighborError(Exception):
     """
 
 
+def write_atomically(path: Path, write: Callable[[str], None]) -> None:
+    """
+    Writes a file through a temporary file of the same directory, so that
+    the file at `path` is either absent or complete.
+
+    Parameters
+    ----------
+    path : Path
+        Final path of the file.
+    write : Callable[[str], None]
+        Function writing the content to the path it is given.
+
+    Raises
+    ------
+    OSError
+        If the file cannot be written. The temporary file is removed.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.",
+                                    suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def read_recipes(path: str) -> DataFrame:
+    """
+    Reads the recipes dataset, through an Arrow IPC (Feather) copy of the
+    CSV.
+
+    The first read parses the CSV, including the lists of steps and
+    ingredients, and saves it next to it in the Arrow IPC format, which is
+    then memory-mapped by the next processes as long as it is newer than the
+    CSV. An unreadable IPC copy is ignored and rewritten from the CSV.
+
+    Parameters
+    ----------
+    path : str
+        Path of the CSV file, whose first column is the recipe ID.
+
+    Returns
+    -------
+    pd.DataFrame
+        The recipes, indexed by recipe ID, with the steps and ingredients
+        as sequences of strings.
+    """
+    csv_path = Path(path)
+    ipc_path = csv_path.with_suffix('.arrow')
+    recipes = None
+    if ipc_path.exists() and \
+            ipc_path.stat().st_mtime >= csv_path.stat().st_mtime:
+        logger.debug("Reading recipes from %s", ipc_path)
+        try:
+            recipes = feather.read_table(ipc_path,
+                                         memory_map=True).to_pandas()
+        except (pa.ArrowInvalid, OSError) as exc:
+            logger.warning("Could not read %s: %s", ipc_path, exc)
+        else:
+            recipes = recipes.set_index(recipes.columns[0]).rename_axis(None)
+    if recipes is None:
+        logger.debug("Reading recipes from %s", csv_path)
+        recipes = pd.read_csv(csv_path, index_col=0,
+                              engine='pyarrow').rename_axis(None)
+        # Parse the lists once, instead of on each display of a recipe
+        for column in recipes.columns.intersection(RECIPE_COLUMNS[1:]):
+            recipes[column] = recipes[column].map(literal_eval)
+        try:
+            # Written aside then moved, so that no other process can read a
+            # partial file
+            write_atomically(ipc_path, recipes.rename_axis('index')
+                             .reset_index().to_feather)
+        except OSError as exc:
+            logger.warning("Could not save %s: %s", ipc_path, exc)
+    return recipes
+
+
 def search_images(search_term: str) -> str:
     """
     Uses the requests library to search for images on Google.
@@ -63,12 +152,43 @@ def search_images(search_term: str) -> str:
     >>> html_content = search_images("chocolate cake")
     >>> print(html_content[:100])  # Print the first 100 characters
     """
-    logger.debug(f"In search_images with search_term={search_term}")
+    logger.debug("In search_images with search_term=%s", search_term)
     url = 'https://www.google.com/search?tbm=isch&q=' + search_term
     response = requests.get(url, timeout=5)
     return response.text
 
 
+def image_urls(search_term: str) -> tuple:
+    """
+    Searches for images and extracts the URLs of the results.
+
+    The results are not cached here: the page caches the image of each
+    recipe for an hour, found or not.
+
+    Parameters
+    ----------
+    search_term : str
+        The name or term to search for images.
+
+    Returns
+    -------
+    tuple of str
+        The URLs of the images found.
+
+    Raises
+    ------
+    ImageError
+        If no images are found.
+    """
+    logger.debug("In image_urls with search_term=%s", search_term)
+    html = search_images(search_term)
+    soup = BeautifulSoup(html, 'html.parser', parse_only=IMG_STRAINER)
+    urls = tuple(img_tag['src'] for img_tag in soup.find_all('img'))
+    if not urls:
+        raise ImageError("No image found for this recipe")
+    return urls
+
+
 def print_image(search_term: str, n: int = 1) -> list:
     """
     Searches for an image and returns a printable URL.
@@ -96,22 +216,16 @@ def print_image(search_term: str, n: int = 1) -> list:
     >>> print(images)
     ['https://example.com/image.jpg']
     """
-    logger.debug(f"In print_image with search_term={search_term}")
+    logger.debug("In print_image with search_term=%s", search_term)
     try:
-        html = search_images(search_term)
-        soup = BeautifulSoup(html, 'html.parser')
-        img_tags = soup.find_all('img', {'src': re.compile('gstatic.com')})
-        imgs = []
-        for i, img_tag in enumerate(img_tags):
-            if i >= n:
-                break
-            imgs.append(img_tag['src'])
+        imgs = list(image_urls(search_term)[:n])
         if not imgs:
             logger.info("No image found for this recipe")
             raise ImageError("No image found for this recipe")
         return imgs
     except Exception as exc:
-        logger.error(f"Error fetching image for recipe {search_term}: {exc}")
+        logger.error("Error fetching image for recipe %s: %s", search_term,
+                     exc)
         raise ImageError("No image found for this recipe") from exc
 
 
@@ -133,8 +247,9 @@ def update_preferences(user: User, recipe_index: int,
     -------
     >>> update_preferences(user, recipe_index=42, preference_value=1)
     """
-    logger.debug(f"Updating preferences for user {user} with recipe_index={
-                 recipe_index} and preference_value={preference_value}")
+    logger.debug("Updating preferences for user %s with recipe_index=%s "
+                 "and preference_value=%s", user, recipe_index,
+                 preference_value)
     user.add_preferences(recipe_index, preference_value)
 
 
@@ -146,7 +261,8 @@ def fetch_recipe_details(recipes_df: DataFrame, recipe_index: int)\
     Parameters
     ----------
     recipes_df : pd.DataFrame
-        The DataFrame containing recipe information.
+        The DataFrame containing recipe information, with the steps and
+        ingredients either parsed or as string representations of lists.
     recipe_index : int
         The index of the recipe to fetch details for.
 
@@ -167,10 +283,12 @@ def fetch_recipe_details(recipes_df: DataFrame, recipe_index: int)\
     >>> print(ingredients)
     ['Ingredient 1', 'Ingredient 2']
     """
-    logger.debug(f"Fetching recipe details for recipe_index={recipe_index}")
-    recipe = recipes_df.loc[recipe_index]
-    steps = literal_eval(recipe[RECIPE_COLUMNS[1]])
-    ingredients = literal_eval(recipe[RECIPE_COLUMNS[2]])
+    logger.debug("Fetching recipe details for recipe_index=%s",
+                 recipe_index)
+    steps, ingredients = (
+        literal_eval(cell) if isinstance(cell, str) else list(cell)
+        for cell in (recipes_df.at[recipe_index, RECIPE_COLUMNS[1]],
+                     recipes_df.at[recipe_index, RECIPE_COLUMNS[2]]))
     return steps, ingredients
 
 
@@ -202,8 +320,8 @@ def visualize_graph(graph: Graph) -> None:
     Parameters:
     - graph: The NetworkX graph to save.
     """
-    logger.debug(f"Visualizing graph with {len(graph.nodes)} \
-                 nodes and {len(graph.edges)} edges")
+    logger.debug("Visualizing graph with %s nodes and %s edges",
+                 len(graph.nodes), len(graph.edges))
     # Create a PyVis Network object
     net = Network(notebook=True, width="100%",
                   height="300px", cdn_resources='remote')